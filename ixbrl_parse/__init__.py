@@ -12,4 +12,7 @@ Example usage:
       for v in c.values.values():
           print(v)
 
+For large files, parse_stream("myfile.ixbrl") reads the file with
+iterparse instead of building the whole tree first.
+
 """
@@ -9,6 +9,7 @@ from lxml import etree as ET
 import datetime
 import sys
 import hashlib
+import functools
 import os
 
 from . import transform
@@ -47,16 +48,150 @@ ROOT = URIRef(LOCAL + "t#root")
 # Instances
 EVERYTHING = LOCAL + "root"
 
-# Create a hex hash, short-hand
-def create_hash(thing):
-    hash = hashlib.sha1(str(thing).encode("utf-8"))
+# Labels and types of the properties and classes above, output once
+# at the root of the context hierarchy.
+DECLARATIONS = (
+    (CONTAINS, LABEL, Literal("contains")),
+    (REPORTS, LABEL, Literal("reports")),
+    (STARTS, LABEL, Literal("starts")),
+    (ENDS, LABEL, Literal("ends")),
+    (DATE, LABEL, Literal("date")),
+
+    (CONTAINS, IS_A, RDFS_PROPERTY),
+    (REPORTS, IS_A, RDFS_PROPERTY),
+    (STARTS, IS_A, RDFS_PROPERTY),
+    (ENDS, IS_A, RDFS_PROPERTY),
+    (DATE, IS_A, RDFS_PROPERTY),
+
+    (CONTEXT, LABEL, Literal("Context")),
+    (DIMENSION, LABEL, Literal("Dimension")),
+    (ENTITY, LABEL, Literal("Entity")),
+    (PERIOD, LABEL, Literal("Period")),
+    (INSTANT, LABEL, Literal("Instant")),
+    (ROOT, LABEL, Literal("Root")),
+
+    (CONTEXT, IS_A, RDFS_CLASS),
+    (DIMENSION, IS_A, RDFS_CLASS),
+    (ENTITY, IS_A, CONTEXT),
+    (PERIOD, IS_A, CONTEXT),
+    (INSTANT, IS_A, CONTEXT),
+    (ROOT, IS_A, CONTEXT),
+
+)
+
+NS = {
+    "ix": "http://www.xbrl.org/2013/inlineXBRL",
+    "xbrli": "http://www.xbrl.org/2003/instance",
+    "xbrldi": "http://xbrl.org/2006/xbrldi",
+    "xlink": "http://www.w3.org/1999/xlink",
+    "link": "http://www.xbrl.org/2003/linkbase"
+}
+
+SCHEMA_REF_TAG = "{%s}schemaRef" % NS["link"]
+UNIT_TAG = "{%s}unit" % NS["xbrli"]
+CONTEXT_TAG = "{%s}context" % NS["xbrli"]
+NON_NUMERIC_TAG = "{%s}nonNumeric" % NS["ix"]
+NON_FRACTION_TAG = "{%s}nonFraction" % NS["ix"]
+CONTINUATION_TAG = "{%s}continuation" % NS["ix"]
+
+# Concepts which give the name of the reporting entity
+ENTITY_NAMES = {
+
+    # Companies House
+    ET.QName(
+        "http://xbrl.frc.org.uk/cd/2019-01-01/business",
+        "EntityCurrentLegalOrRegisteredName"
+    ),
+
+    # SEC
+    ET.QName(
+        "http://xbrl.sec.gov/dei/2020-01-31",
+        "EntityRegistrantName"
+    ),
+
+    # ESEF
+    ET.QName(
+        "http://xbrl.ifrs.org/taxonomy/2017-03-09/ifrs-full",
+        "NameOfReportingEntityOrOtherMeansOfIdentification"
+    ),
+
+}
+
+# Path expressions used on every unit / context, compiled once.  They
+# follow the xbrli schema's element structure with child steps rather
+# than searching all descendants.
+def _xpath(path):
+    return ET.XPath(path, namespaces=NS)
+
+_XP_DIVIDE_NUM = _xpath("xbrli:divide/xbrli:unitNumerator/xbrli:measure")
+_XP_DIVIDE_DEN = _xpath("xbrli:divide/xbrli:unitDenominator/xbrli:measure")
+_XP_DIVIDE_NUM_LC = _xpath("xbrli:divide/xbrli:unitnumerator/xbrli:measure")
+_XP_DIVIDE_DEN_LC = _xpath("xbrli:divide/xbrli:unitdenominator/xbrli:measure")
+_XP_MEASURE = _xpath("xbrli:measure")
+_XP_IDENTIFIER = _xpath("xbrli:entity/xbrli:identifier")
+_XP_PERIOD = _xpath("xbrli:period")
+_XP_START_DATE = _xpath("xbrli:startDate")
+_XP_END_DATE = _xpath("xbrli:endDate")
+_XP_INSTANT = _xpath("xbrli:instant")
+_XP_EXPLICIT_MEMBER = _xpath(
+    "xbrli:entity/xbrli:segment/xbrldi:explicitMember"
+)
+
+# Like Element.find: first match of a compiled XPath, or None
+def _find(xpath, elt):
+    found = xpath(elt)
+    if found: return found[0]
+    return None
+
+# Create a hex hash, short-hand.  The same few strings (e.g. entity
+# schemes) get hashed over and over, so results are memoized.  Stays SHA-1:
+# the hash appears in entity URIs, which must be stable across releases.
+@functools.lru_cache(maxsize=8192)
+def create_hash(s):
+    hash = hashlib.sha1(s.encode("utf-8"))
     return hash.hexdigest()
 
-def to_qname(elt, name):
-    ns, name = name.split(":", 2)
-    ns = elt.nsmap[ns]
+# URIs and labels recur all over the triple output (context URIs, property
+# URIs, axis names), so share one object per distinct string.
+@functools.lru_cache(maxsize=100000)
+def to_uri(s):
+    return URIRef(s)
+
+@functools.lru_cache(maxsize=100000)
+def to_literal(s):
+    return Literal(s)
+
+# URI for a concept or member name, e.g. as an RDF property.  A filing
+# reports the same few hundred concepts across all its contexts.
+@functools.lru_cache(maxsize=100000)
+def qname_uri(name):
+    return to_uri("%s#%s" % (name.namespace, name.localname))
+
+# Period dates are xs:date or xs:dateTime, either may carry a timezone
+# (2020-01-01Z, 2020-01-01+01:00) and surrounding whitespace.  Only the
+# date part is kept.  An endDate of T24:00:00 is the end of that same day,
+# which is also what a plain date endDate means, so it maps to that date.
+# Raises ValueError if there is no usable date.
+def to_date(s):
+    if s is None:
+        raise ValueError("Empty date")
+    s = s.strip()
+    if s[10:11] not in { "", "T", "Z", "+", "-" }:
+        raise ValueError("Invalid date: %s" % s)
+    return datetime.date.fromisoformat(s[:10])
+
+# The same few names occur throughout a document, share the QNames
+@functools.lru_cache(maxsize=8192)
+def make_qname(ns, name):
     return ET.QName(ns, name)
 
+# elt.nsmap is rebuilt on every access, callers resolving several names on
+# one element can fetch it once and pass it in.
+def to_qname(elt, name, nsmap=None):
+    if nsmap == None: nsmap = elt.nsmap
+    ns, name = name.split(":", 2)
+    return make_qname(nsmap[ns], name)
+
 class Unit:
     """A unit"""
     pass
@@ -97,8 +232,8 @@ class Context:
         The context's date period (None if not specified).
     instant : Period
         The context's instant date (None if not specified).
-    dimensions : list<Dimension>
-        List of dimensions, empty list if none.
+    dimensions : tuple<Dimension>
+        Tuple of dimensions, empty tuple if none.
     values : list<Value>
         List of values defined under this context.
     children : map<Relationship, Context>
@@ -148,17 +283,22 @@ class Context:
         self.entity = None
         self.period = None
         self.instant = None
-        self.dimensions = []
+        self.dimensions = ()
         self.values = {}
         self.children = {}
+        self._uri = None
+        self._rel_id = None
     def copy(self):
         c = Context()
         c.entity = self.entity
         c.period = self.period
         c.instant = self.instant
-        c.dimensions = [v for v in self.dimensions]
+        # Never changed in place, so the child can share it
+        c.dimensions = self.dimensions
         return c
     def modify(self, rel):
+        self._uri = None
+        self._rel_id = None
         if isinstance(rel, Entity):
             self.entity = rel
         elif isinstance(rel, Period):
@@ -166,7 +306,7 @@ class Context:
         elif isinstance(rel, Instant):
             self.instant = rel
         elif isinstance(rel, Dimension):
-            self.dimensions.append(rel)
+            self.dimensions = self.dimensions + (rel,)
 
     def flatten(self):
 
@@ -280,14 +420,22 @@ class Context:
         return rels
 
     def get_id(self):
-        rels = self.get_relationships()
-        rep = "//".join([str(v) for v in rels])
-        return create_hash(rep)
+        if self._rel_id is None:
+            rels = self.get_relationships()
+            rep = "//".join([str(v) for v in rels])
+            self._rel_id = create_hash(rep)
+        return self._rel_id
 
     def get_uri(self):
         """Constructs a URI for the context which is usable in e.g. RDF
-        output
+        output.  The result is cached, modify() invalidates it.
         """
+        if self._uri is None:
+            self._uri = self._compute_uri()
+        return self._uri
+
+    def _compute_uri(self):
+
         rels = self.get_relationships()
 
         if len(rels) == 0: return EVERYTHING
@@ -308,158 +456,114 @@ class Context:
         """
 
         tpl = []
+        self.add_triples(tpl, rel, entity_name)
+        return tpl
+
+    def add_triples(self, tpl, rel=None, entity_name=None, seen_axes=None):
+        """
+        As get_triples, but appends the triples to the list tpl, which
+        is shared by the whole walk over the context hierarchy.
+        seen_axes holds the dimensions already described, so that each
+        is only described once.
+        """
+
+        if seen_axes == None:
+            seen_axes = set()
 
         if rel == None:
-            tpl.extend([
-                (CONTAINS, LABEL, Literal("contains")),
-                (REPORTS, LABEL, Literal("reports")),
-                (STARTS, LABEL, Literal("starts")),
-                (ENDS, LABEL, Literal("ends")),
-                (DATE, LABEL, Literal("date")),
-
-                (CONTAINS, IS_A, RDFS_PROPERTY),
-                (REPORTS, IS_A, RDFS_PROPERTY),
-                (STARTS, IS_A, RDFS_PROPERTY),
-                (ENDS, IS_A, RDFS_PROPERTY),
-                (DATE, IS_A, RDFS_PROPERTY),
-
-                (CONTEXT, LABEL, Literal("Context")),
-                (DIMENSION, LABEL, Literal("Dimension")),
-                (ENTITY, LABEL, Literal("Entity")),
-                (PERIOD, LABEL, Literal("Period")),
-                (INSTANT, LABEL, Literal("Instant")),
-                (ROOT, LABEL, Literal("Root")),
-
-                (CONTEXT, IS_A, RDFS_CLASS),
-                (DIMENSION, IS_A, RDFS_CLASS),
-                (ENTITY, IS_A, CONTEXT),
-                (PERIOD, IS_A, CONTEXT),
-                (INSTANT, IS_A, CONTEXT),
-                (ROOT, IS_A, CONTEXT),
-
-            ])
+            tpl.extend(DECLARATIONS)
+
+        uri = to_uri(self.get_uri())
 
         if rel == None:
             tpl.append((
-                URIRef(self.get_uri()), IS_A, ROOT
+                uri, IS_A, ROOT
             ))
         elif isinstance(rel, Dimension):
+            axis = rel.get_type()
             tpl.append((
-                URIRef(self.get_uri()), IS_A, rel.get_type()
-            ))
-            tpl.append((
-                rel.get_type(), IS_A, DIMENSION
-            ))
-            tpl.append((
-                rel.get_type(), LABEL, Literal(rel.dimension.localname)
+                uri, IS_A, axis
             ))
+            if axis not in seen_axes:
+                seen_axes.add(axis)
+                tpl.append((
+                    axis, IS_A, DIMENSION
+                ))
+                tpl.append((
+                    axis, LABEL, to_literal(rel.dimension.localname)
+                ))
         else:
             tpl.append((
-                URIRef(self.get_uri()), IS_A, rel.get_type()
+                uri, IS_A, rel.get_type()
             ))
 
         if rel == None:
             tpl.append((
-                URIRef(self.get_uri()),
+                uri,
                 LABEL,
                 Literal("everything")
             ))
         elif isinstance(rel, Entity) and entity_name != None:
             tpl.append((
-                URIRef(self.get_uri()),
+                uri,
                 LABEL,
                 Literal(entity_name)
             ))
         else:
             tpl.append((
-                URIRef(self.get_uri()),
+                uri,
                 LABEL,
-                Literal(rel.get_description())
+                to_literal(rel.get_description())
             ))
 
         for rel, c in self.children.items():
-            if isinstance(rel, Entity):
-                tpl.append((
-                    URIRef(self.get_uri()),
-                    CONTAINS,
-                    URIRef(c.get_uri())
-                ))
-            elif isinstance(rel, Period):
-                tpl.append((
-                    URIRef(self.get_uri()),
-                    REPORTS,
-                    URIRef(c.get_uri())
-                ))
-                tpl.append((
-                    URIRef(c.get_uri()),
-                    STARTS,
-                    rel.get_start().to_rdf()
-                ))
-                tpl.append((
-                    URIRef(c.get_uri()),
-                    ENDS,
-                    rel.get_end().to_rdf()
-                ))
-            elif isinstance(rel, Instant):
-                tpl.append((
-                    URIRef(self.get_uri()),
-                    REPORTS,
-                    URIRef(c.get_uri())
-                ))
-                tpl.append((
-                    URIRef(c.get_uri()),
-                    DATE,
-                    rel.get_date().to_rdf()
-                ))
-            elif isinstance(rel, Dimension):
-                tpl.append((
-                    URIRef(self.get_uri()),
-                    rel.get_name_uri(),
-                    URIRef(c.get_uri())
-                ))
+            rel.add_edge_triples(tpl, uri, to_uri(c.get_uri()))
+            c.add_triples(tpl, rel, entity_name, seen_axes)
 
-            tpl.extend(c.get_triples(rel, entity_name))
+        self.add_value_triples(tpl)
 
-        tpl.extend(self.get_value_triples())
+    def get_value_triples(self):
 
+        tpl = []
+        self.add_value_triples(tpl)
         return tpl
 
-    def get_value_triples(self):
+    def add_value_triples(self, tpl):
 
-        tpl = []
+        uri = to_uri(self.get_uri())
 
         for name, value in self.values.items():
 
+            prop = qname_uri(name)
+
             if isinstance(value, ET.QName):
 
                 tpl.append((
-                    URIRef(self.get_uri()),
-                    URIRef("%s#%s" % (name.namespace, name.localname)),
-                    URIRef("%s#%s" % (value.namespace, value.localname))
+                    uri,
+                    prop,
+                    qname_uri(value)
                 ))
 
             else:
 
                 tpl.append((
-                    URIRef(self.get_uri()),
-                    URIRef("%s#%s" % (name.namespace, name.localname)),
+                    uri,
+                    prop,
                     value.to_value().to_rdf()
                 ))
 
             tpl.append((
-                URIRef("%s#%s" % (name.namespace, name.localname)),
+                prop,
                 IS_A,
                 RDFS_PROPERTY
             ))
 
             tpl.append((
-                URIRef("%s#%s" % (name.namespace, name.localname)),
+                prop,
                 LABEL,
-                Literal(name.localname)
+                to_literal(name.localname)
             ))
 
-        return tpl
-
     def get_values_df(self):
         return dataframe.values_to_df(self.values)
 
@@ -493,22 +597,15 @@ class Value:
 
     @staticmethod
     def recurse_elts(elt, lower=False):
-        a = ""
-        if elt.text:
-            # This is probably right, but causes some things to appear wrong.
-            a += elt.text 
-#            a += elt.text + " "
-        for s in elt:
-            a += Value.recurse_elts(s, True)
+        # Text of the element and all descendants, plus the element's own
+        # tail if it is below the top level.  itertext does the walk in C.
+        a = "".join(elt.itertext())
         if lower and elt.tail:
             a += elt.tail
         return a
 
     def get_raw(self):
-        value = ""
-        for elt in self.elements:
-            value += Value.recurse_elts(elt)
-        return value
+        return "".join([Value.recurse_elts(elt) for elt in self.elements])
 
     def to_string(self):
         """Represent as string"""
@@ -590,12 +687,18 @@ class Fraction(Value):
         raise RuntimeError("Not implemented: Fraction")
 
 class Relationship:
-    """Represents a single fragment of the context definition.
+    """Represents a single fragment of the context definition.  These
+    don't change once made, subclasses build their string and URL forms
+    in the constructor.
     """
+    _hash = None
     def __repr__(self):
         return str(self)
     def __hash__(self):
-        return str(self).__hash__()
+        h = self._hash
+        if h is None:
+            h = self._hash = str(self).__hash__()
+        return h
     def __eq__(self, other):
         return str(self) == str(other)
     def get_id(self):
@@ -603,6 +706,10 @@ class Relationship:
         return create_hash(rep)
     def get_description(self):
         return str(self)
+    def add_edge_triples(self, tpl, parent_uri, child_uri):
+        """Appends the triples linking a parent context to the child
+        context reached through this relationship."""
+        raise RuntimeError("Not implemented: add_edge_triples")
 
 class Entity(Relationship):
     """Describes the entity definition of a context."""
@@ -610,8 +717,10 @@ class Entity(Relationship):
         self.id = id
         self.scheme = scheme
         self.name = None
+        self._str = "entity(%s,%s)" % (id, scheme)
+        self._url_part = "%s/%s/" % (create_hash(str(scheme))[0:4], id)
     def __str__(self):
-        return("entity(%s,%s)" % (self.id, self.scheme))
+        return self._str
     def __repr__(self):
         return str(self)
     def get_description(self):
@@ -626,7 +735,9 @@ class Entity(Relationship):
     def get_type(self):
         return ENTITY
     def url_part(self):
-        return create_hash(self.scheme)[0:4] + "/" + self.id + "/"
+        return self._url_part
+    def add_edge_triples(self, tpl, parent_uri, child_uri):
+        tpl.append((parent_uri, CONTAINS, child_uri))
     def to_dict(self):
         return {
             "id": self.id,
@@ -637,8 +748,10 @@ class Period(Relationship):
     """Describes the period definition of a context."""
     def __init__(self, start, end):
         self.start, self.end = start, end
+        self._str = "period(%s,%s)" % (start, end)
+        self._url_part = "%s-%s/" % (start, end)
     def __str__(self):
-        return("period(%s,%s)" % (self.start, self.end))
+        return self._str
     def get_description(self):
         return "%s - %s" % (
             self.start, self.end
@@ -646,7 +759,11 @@ class Period(Relationship):
     def get_type(self):
         return PERIOD
     def url_part(self):
-        return "%s-%s/" % (self.start, self.end)
+        return self._url_part
+    def add_edge_triples(self, tpl, parent_uri, child_uri):
+        tpl.append((parent_uri, REPORTS, child_uri))
+        tpl.append((child_uri, STARTS, self.get_start().to_rdf()))
+        tpl.append((child_uri, ENDS, self.get_end().to_rdf()))
     def get_start(self):
         return Date(self.start)
     def get_end(self):
@@ -656,14 +773,19 @@ class Instant(Relationship):
     """Describes the period instant definition of a context."""
     def __init__(self, instant):
         self.instant = instant
+        self._str = "instant(%s)" % instant
+        self._url_part = "%s/" % instant
     def __str__(self):
-        return("instant(%s)" % (self.instant))
+        return self._str
     def get_description(self):
         return "%s" % self.instant
     def get_type(self):
         return INSTANT
     def url_part(self):
-        return "%s/" % (self.instant)
+        return self._url_part
+    def add_edge_triples(self, tpl, parent_uri, child_uri):
+        tpl.append((parent_uri, REPORTS, child_uri))
+        tpl.append((child_uri, DATE, self.get_date().to_rdf()))
     def get_date(self):
         return Date(self.instant)
 
@@ -672,24 +794,26 @@ class Dimension(Relationship):
     def __init__(self, dimension, value):
         self.dimension = dimension
         self.value = value
+        self._str = "dimension(%s,%s)" % (dimension, value)
+        self._url_part = "%s=%s/" % (dimension.localname, value.localname)
+        self._name_uri = qname_uri(dimension)
+        self._value_uri = qname_uri(value)
     def __str__(self):
-        return("dimension(%s,%s)" % (self.dimension, self.value))
+        return self._str
     def get_description(self):
         return "%s" % (
             self.value.localname
         )
     def get_type(self):
-        return URIRef(self.get_name_uri())
+        return self._name_uri
     def url_part(self):
-        return "%s=%s/" % (self.dimension.localname, self.value.localname)
+        return self._url_part
+    def add_edge_triples(self, tpl, parent_uri, child_uri):
+        tpl.append((parent_uri, self._name_uri, child_uri))
     def get_name_uri(self):
-        return URIRef("%s#%s" % (
-            self.dimension.namespace, self.dimension.localname
-        ))
+        return self._name_uri
     def get_value_uri(self):
-        return URIRef("%s#%s" % (
-            self.value.namespace, self.value.localname
-        ))
+        return self._value_uri
 
 class XbrlInstance:
     """
@@ -706,28 +830,44 @@ class XbrlInstance:
 
     def __init__(self):
         self.root = Context()
+        # Contexts by their full relationship list, a shortcut past
+        # walking the hierarchy for relationship sets seen before.
+        self._by_rels = { (): self.root }
+        self.schemas = []
+        self.units = {}
+        self.contexts = {}
+        self.values = {}
 
     def get_context(self, rels):
 
+        key = tuple(rels)
+
+        cx = self._by_rels.get(key)
+
+        if cx is not None:
+            return cx
+
         cx = self.root
 
         for rel in rels:
             cx = self.lookup_context(cx, rel)
 
+        self._by_rels[key] = cx
+
         return cx
 
     def lookup_context(self, cx, rel):
 
-        key = rel
+        ncx = cx.children.get(rel)
 
-        if key in cx.children:
-            return cx.children[key]
+        if ncx is not None:
+            return ncx
 
         ncx = cx.copy()
 
         ncx.modify(rel)
 
-        cx.children[key] = ncx
+        cx.children[rel] = ncx
 
         return ncx
 
@@ -739,27 +879,9 @@ class XbrlInstance:
 
     def get_entity_name(self):
 
-        # Companies House
-        ent_legal_name = ET.QName(
-            "http://xbrl.frc.org.uk/cd/2019-01-01/business",
-            "EntityCurrentLegalOrRegisteredName"
-        )
-
-        # SEC
-        ent_reg_name = ET.QName(
-            "http://xbrl.sec.gov/dei/2020-01-31",
-            "EntityRegistrantName"
-        )
-
-        # ESEF
-        name_of_rep_ent = ET.QName(
-            "http://xbrl.ifrs.org/taxonomy/2017-03-09/ifrs-full",
-            "NameOfReportingEntityOrOtherMeansOfIdentification"
-        )
-
         for c in self.contexts.values():
             for v in c.values.values():
-                if v.name in {ent_legal_name, ent_reg_name, name_of_rep_ent}:
+                if v.name in ENTITY_NAMES:
                     return v.to_string()
 
         return None
@@ -809,227 +931,318 @@ class XbrlInstance:
 
         i = XbrlInstance()
 
-        values = {}
-
-        ns = {
-            "ix": "http://www.xbrl.org/2013/inlineXBRL",
-            "xbrli": "http://www.xbrl.org/2003/instance",
-            "xbrldi": "http://xbrl.org/2006/xbrldi",
-            "xlink": "http://www.w3.org/1999/xlink",
-            "link": "http://www.xbrl.org/2003/linkbase"
+        schema_ref_elts = []
+        non_numeric_elts = []
+        unit_elts = []
+        context_elts = []
+        non_fraction_elts = []
+        continuation_elts = []
+
+        # Collect everything of interest in a single walk of the document,
+        # rather than a separate descendant search for each element type.
+        collect = {
+            SCHEMA_REF_TAG: schema_ref_elts.append,
+            NON_NUMERIC_TAG: non_numeric_elts.append,
+            UNIT_TAG: unit_elts.append,
+            CONTEXT_TAG: context_elts.append,
+            NON_FRACTION_TAG: non_fraction_elts.append,
+            CONTINUATION_TAG: continuation_elts.append,
         }
 
-        units = {}
+        for elt in doc.iter():
+            fn = collect.get(elt.tag)
+            if fn: fn(elt)
 
-        # FIXME: Delete entity_name from here.
-        entity_name = None
+        for elt in schema_ref_elts:
+            i.add_schema_ref(elt)
 
-        i.schemas = []
-        for elt in doc.findall(".//link:schemaRef", ns):
-            i.schemas.append(elt.get(ET.QName(ns["xlink"], "href")))
+        for elt in unit_elts:
+            i.add_unit(elt)
 
-        for elt in doc.findall(".//ix:nonNumeric", ns):
+        for elt in context_elts:
+            i.add_context(elt)
 
-            name = to_qname(elt, elt.get("name"))
-            v = NonNumeric()
-            v.elements = [elt]
+        continuation = {}
+        continued = []
 
-            # Companies House
-            ent_legal_name = ET.QName(
-                "http://xbrl.frc.org.uk/cd/2019-01-01/business",
-                "EntityCurrentLegalOrRegisteredName"
-            )
+        for elt in continuation_elts:
+            continuation[elt.get("id")] = elt
 
-            # SEC
-            ent_reg_name = ET.QName(
-                "http://xbrl.sec.gov/dei/2020-01-31",
-                "EntityRegistrantName"
-            )
+        for elt in non_numeric_elts:
+            i.add_value(i.make_non_numeric(elt, continued))
 
-            # ESEF
-            name_of_rep_ent = ET.QName(
-                "http://xbrl.ifrs.org/taxonomy/2017-03-09/ifrs-full",
-                "NameOfReportingEntityOrOtherMeansOfIdentification"
-            )
+        for elt in non_fraction_elts:
+            i.add_value(i.make_non_fraction(elt, continued))
+
+        resolve_continuations(continued, continuation)
 
-            if entity_name == None:
-                if name == ent_legal_name:
-                    entity_name = v.to_string()
-                if name == ent_reg_name:
-                    entity_name = v.to_string()
-                if name == name_of_rep_ent:
-                    entity_name = v.to_string()
+        return i
 
-        for unit_elt in doc.findall(".//xbrli:unit", ns):
+    @staticmethod
+    def parse_stream(source):
+        """ Parses an iXBRL document from a filename or file object
+        without holding the whole tree in memory, only the fact elements
+        are kept.  The source is read twice: once for schema references,
+        units and contexts, then again for the facts, so file objects
+        must be seekable.
 
-            id = unit_elt.get("id")
+        Returns
+        -------
+        An XbrlInstance object.
+        """
 
-            try:
-                div_elt = unit_elt.find("xbrli:divide", ns)
-                num_elt = div_elt.find(
-                    "./xbrli:unitNumerator/xbrli:measure", ns
-                )
-                den_elt = div_elt.find(
-                    "./xbrli:unitDenominator/xbrli:measure", ns
+        # Read twice, so a file object has to be rewound in between.
+        # Check before doing any work, a pipe can't be.
+        if hasattr(source, "read"):
+            if not (hasattr(source, "seekable") and source.seekable()):
+                raise RuntimeError(
+                    "parse_stream needs a filename or seekable file object"
                 )
+            start = source.tell()
 
-                unit = Divide(
-                    Measure(to_qname(num_elt, num_elt.text)),
-                    Measure(to_qname(den_elt, den_elt.text))
-                )
-                unit.id = id
+        i = XbrlInstance()
 
-                units[id] = unit
+        handlers = {
+            SCHEMA_REF_TAG: i.add_schema_ref,
+            UNIT_TAG: i.add_unit,
+            CONTEXT_TAG: i.add_context,
+        }
+
+        for event, elt in _iterparse_pruned(source, handlers):
+            if event == "end":
+                handlers[elt.tag](elt)
+                elt.clear()
+
+        if hasattr(source, "read"):
+            source.seek(start)
+
+        continuation = {}
+        continued = []
+        non_numerics = []
+        non_fractions = []
+
+        # Fact elements are kept, values read their text lazily.  Values
+        # are made on the start event, which gives document order for
+        # nested facts, only attributes are needed at that point.
+        fact_tags = { NON_NUMERIC_TAG, NON_FRACTION_TAG, CONTINUATION_TAG }
 
+        for event, elt in _iterparse_pruned(source, fact_tags):
+            if event == "end":
                 continue
+            if elt.tag == NON_NUMERIC_TAG:
+                non_numerics.append(i.make_non_numeric(elt, continued))
+            elif elt.tag == NON_FRACTION_TAG:
+                non_fractions.append(i.make_non_fraction(elt, continued))
+            else:
+                continuation[elt.get("id")] = elt
 
-            except:
-                pass
+        # Same order as parse, so that the two give identical results.
+        for v in non_numerics:
+            i.add_value(v)
 
-            try:
-                div_elt = unit_elt.find("xbrli:divide", ns)
-                num_elt = div_elt.find(
-                    "./xbrli:unitnumerator/xbrli:measure", ns
-                )
-                den_elt = div_elt.find(
-                    "./xbrli:unitdenominator/xbrli:measure", ns
-                )
+        for v in non_fractions:
+            i.add_value(v)
 
-                unit = Divide(
-                    Measure(to_qname(num_elt, num_elt.text)),
-                    Measure(to_qname(den_elt, den_elt.text))
-                )
-                unit.id = id
+        resolve_continuations(continued, continuation)
 
-                units[id] = unit
+        return i
 
-                continue
+    def add_schema_ref(self, elt):
+
+        self.schemas.append(elt.get(ET.QName(NS["xlink"], "href")))
+
+    def add_unit(self, unit_elt):
+
+        id = unit_elt.get("id")
+
+        try:
+            num_elt = _find(_XP_DIVIDE_NUM, unit_elt)
+            den_elt = _find(_XP_DIVIDE_DEN, unit_elt)
 
-            except:
-                pass
+            unit = Divide(
+                Measure(to_qname(num_elt, num_elt.text)),
+                Measure(to_qname(den_elt, den_elt.text))
+            )
+            unit.id = id
+
+            self.units[id] = unit
+
+            return
+
+        except:
+            pass
 
-            meas_elt = unit_elt.find("xbrli:measure", ns)
-            units[id] = Measure(to_qname(meas_elt, meas_elt.text))
-            units[id].id = id
+        try:
+            num_elt = _find(_XP_DIVIDE_NUM_LC, unit_elt)
+            den_elt = _find(_XP_DIVIDE_DEN_LC, unit_elt)
 
-        contexts = {}
+            unit = Divide(
+                Measure(to_qname(num_elt, num_elt.text)),
+                Measure(to_qname(den_elt, den_elt.text))
+            )
+            unit.id = id
+
+            self.units[id] = unit
 
-        for ctxt_elt in doc.findall(".//xbrli:context", ns):
+            return
 
-            rels = []
+        except:
+            pass
 
-            id = ctxt_elt.get("id")
+        meas_elt = _find(_XP_MEASURE, unit_elt)
+        self.units[id] = Measure(to_qname(meas_elt, meas_elt.text))
+        self.units[id].id = id
 
-            for ent_elt in ctxt_elt.findall(".//xbrli:entity", ns):
-                for id_elt in ent_elt.findall(".//xbrli:identifier", ns):
-                    rels.append(Entity(id_elt.text, id_elt.get("scheme")))
+    def add_context(self, ctxt_elt):
+
+        rels = []
 
-            for ent_elt in ctxt_elt.findall(".//xbrli:period", ns):
+        id = ctxt_elt.get("id")
+
+        for id_elt in _XP_IDENTIFIER(ctxt_elt):
+            rels.append(Entity(id_elt.text, id_elt.get("scheme")))
+
+        for ent_elt in _XP_PERIOD(ctxt_elt):
+
+            sd_elt = _find(_XP_START_DATE, ent_elt)
+            ed_elt = _find(_XP_END_DATE, ent_elt)
+            if sd_elt is not None and ed_elt is not None:
                 try:
-                    sd = ent_elt.find(".//xbrli:startDate", ns).text
-                    sd = datetime.datetime.fromisoformat(sd).date()
-                    ed = ent_elt.find(".//xbrli:endDate", ns).text
-                    ed = datetime.datetime.fromisoformat(ed).date()
+                    sd = to_date(sd_elt.text)
+                    ed = to_date(ed_elt.text)
                     rels.append(Period(sd, ed))
-                except:
+                except ValueError:
+                    # Unreadable dates, the context keeps its other parts
                     pass
 
+            inst_elt = _find(_XP_INSTANT, ent_elt)
+            if inst_elt is not None:
                 try:
-                    inst = ent_elt.find(".//xbrli:instant", ns).text
-                    inst = datetime.datetime.fromisoformat(inst).date()
-                    rels.append(Instant(inst))
-                except:
+                    rels.append(Instant(to_date(inst_elt.text)))
+                except ValueError:
                     pass
 
-            for seg_elt in ctxt_elt.findall(".//xbrli:segment", ns):
-                for em_elt in seg_elt.findall(".//xbrldi:explicitMember", ns):
+        for em_elt in _XP_EXPLICIT_MEMBER(ctxt_elt):
 
-                    dimension = to_qname(em_elt, em_elt.get("dimension"))
-                    value = to_qname(em_elt, em_elt.text.strip())
+            nsmap = em_elt.nsmap
+            dimension = to_qname(em_elt, em_elt.get("dimension"), nsmap)
+            value = to_qname(em_elt, em_elt.text.strip(), nsmap)
 
-                    rels.append(Dimension(dimension, value))
+            rels.append(Dimension(dimension, value))
 
-            ctxt = i.get_context(rels)
+        ctxt = self.get_context(rels)
 
-            # This might relable another context.
-            ctxt.id = id
+        # This might relable another context.
+        ctxt.id = id
 
-            contexts[id] = ctxt
+        self.contexts[id] = ctxt
 
-        continuation = {}
+    def add_value(self, v):
 
-        for elt in doc.findall(".//ix:continuation", ns):
-            cid = elt.get("id")
-            continuation[cid] = elt
-
-        for elt in doc.findall(".//ix:nonNumeric", ns):
-            name = to_qname(elt, elt.get("name"))
-            cont = elt.get("continuedAt")
-            ctxt = contexts[elt.get("contextRef")]
-            key = (ctxt, name)
-            v = NonNumeric()
-            v.name = name
-            v.context = ctxt
-            v.elements = [elt]
-
-            format = elt.get("format")
-            if format:
-                v.format = to_qname(elt, format)
-
-            ctxt.values[name] = v
-            values[key] = v
-
-            while cont != None:
-                contelt = continuation[cont]
-                v.elements.append(contelt)
-                cont = contelt.get("continuedAt")
+        v.context.values[v.name] = v
+        self.values[(v.context, v.name)] = v
 
-        for elt in doc.findall(".//ix:nonFraction", ns):
-            name = to_qname(elt, elt.get("name"))
-            ctxt = contexts[elt.get("contextRef")]
-            cont = elt.get("continuedAt")
-            key = (ctxt, name)
+    def make_non_numeric(self, elt, continued):
 
-            try:
-                scale = elt.get("scale")
-                scale = 10 ** int(scale)
-            except:
-                scale = 1
+        nsmap = elt.nsmap
+        name = to_qname(elt, elt.get("name"), nsmap)
+        cont = elt.get("continuedAt")
+        ctxt = self.contexts[elt.get("contextRef")]
+        v = NonNumeric()
+        v.name = name
+        v.context = ctxt
+        v.elements = [elt]
 
-            v = NonFraction()
-            v.name = name
-            v.context = ctxt
+        format = elt.get("format")
+        if format:
+            v.format = to_qname(elt, format, nsmap)
 
-            v.decimals = elt.get("decimals")
+        if cont != None:
+            continued.append((v, cont, False))
 
-            if elt.get("sign") == "-":
-                v.sign = -1
-            else:
-                v.sign = 1
+        return v
+
+    def make_non_fraction(self, elt, continued):
+
+        nsmap = elt.nsmap
+        name = to_qname(elt, elt.get("name"), nsmap)
+        ctxt = self.contexts[elt.get("contextRef")]
+        cont = elt.get("continuedAt")
+
+        try:
+            scale = elt.get("scale")
+            scale = 10 ** int(scale)
+        except:
+            scale = 1
+
+        v = NonFraction()
+        v.name = name
+        v.context = ctxt
+
+        v.decimals = elt.get("decimals")
+
+        if elt.get("sign") == "-":
+            v.sign = -1
+        else:
+            v.sign = 1
+
+        format = elt.get("format")
+        if format:
+            v.format = to_qname(elt, format, nsmap)
+        else:
+            v.format = None
+
+        v.scale = scale
+        v.elements = [elt]
+        v.unit = self.units[elt.get("unitRef")]
 
-            format = elt.get("format")
-            if format:
-                v.format = to_qname(elt, format)
+        if cont != None:
+            continued.append((v, cont, True))
+
+        return v
+
+def resolve_continuations(continued, continuation):
+    """Attaches ix:continuation content to the values which continue into
+    it.  continued is a list of (value, continuedAt id, by-child flag),
+    continuation maps id to ix:continuation element.  Each chain is
+    walked once, from the value that starts it.
+    """
+
+    for v, cont, by_child in continued:
+        while cont != None:
+            contelt = continuation[cont]
+            if by_child:
+                v.elements.extend(contelt)
             else:
-                v.format = None
+                v.elements.append(contelt)
+            cont = contelt.get("continuedAt")
 
-            v.scale = scale
-            v.elements = [elt]
-            v.unit = units[elt.get("unitRef")]
-            ctxt.values[name] = v
-            values[key] = v
+# Generates iterparse start/end events for elements with the given tags.
+# Everything outside those elements is freed as soon as it has been
+# parsed, so the tree never builds up in memory.  Elements with the tags
+# are left intact, callers keep or clear them as needed.
+def _iterparse_pruned(source, tags):
 
-            while cont != None:
-                contelt = continuation[cont]
-                for s in contelt:
-                    v.elements.append(s)
-                cont = contelt.get("continuedAt")
+    depth = 0
 
-        i.units = units
-        i.values = values
-        i.contexts = contexts
+    for event, elt in ET.iterparse(source, events=("start", "end")):
 
-        return i
+        if elt.tag in tags:
+            if event == "start":
+                depth += 1
+            else:
+                depth -= 1
+            yield event, elt
+            if event == "start" or depth > 0: continue
+        elif event == "start" or depth > 0:
+            continue
+        else:
+            elt.clear()
+
+        parent = elt.getparent()
+        if parent is not None:
+            while elt.getprevious() is not None:
+                del parent[0]
 
 # Takes an ElementTree document and extracts an XbrlInstance
 def parse(doc):
@@ -1040,3 +1253,14 @@ def parse(doc):
     An XbrlInstance object.
     """
     return XbrlInstance.parse(doc)
+
+# Takes a filename or file object and extracts an XbrlInstance
+def parse_stream(source):
+    """ Parses an iXBRL document from a filename or seekable file object
+    using iterparse, keeping memory use well below a full tree.
+
+    Returns
+    -------
+    An XbrlInstance object.
+    """
+    return XbrlInstance.parse_stream(source)